@@ -1,13 +1,26 @@
+import asyncio
+import base64
+import contextlib
+import functools
+import hashlib
 import os
+import posixpath
+import shutil
 import subprocess
 import tempfile
+import time
 from pathlib import Path
-from urllib.parse import urlparse, urlunparse, quote
+from urllib.parse import urlparse
 import re
 from typing import Optional
 
 from fastmcp import FastMCP
 
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock is available
+    fcntl = None
+
 # MCP server instance
 mcp = FastMCP("overleaf-mcp")
 
@@ -16,75 +29,285 @@ OVERLEAF_GIT_URL = os.environ.get("OVERLEAF_GIT_URL")
 OVERLEAF_EMAIL = os.environ.get("OVERLEAF_EMAIL")  # only for commit metadata
 OVERLEAF_TOKEN = os.environ.get("OVERLEAF_TOKEN")
 
+# Persistent clone of the Overleaf project, one per project URL, kept in the
+# user cache dir so it survives restarts and is shared between server
+# processes. Use _locked_repo() while syncing or touching files inside it.
+_CACHE_DIR = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "overleaf-mcp"
+    / hashlib.sha1((OVERLEAF_GIT_URL or "").encode()).hexdigest()[:12]
+)
+_REPO_DIR = _CACHE_DIR / "repo"
+_REPO_LOCK = asyncio.Lock()
+
+# Touched after every successful sync. A burst of tool calls (an agent
+# listing, reading, then editing) within _SYNC_MAX_AGE seconds shares one
+# fetch; deleting the stamp forces the next call to fetch again.
+_SYNC_STAMP = _CACHE_DIR / "synced"
+_SYNC_MAX_AGE = 5.0
+
+# Process umask, applied to files the write tool creates. os.umask can only
+# be read by setting it, so do that once at import.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Overleaf expects HTTP basic auth with username "git" and the token as the
+# password. It is sent as a header through git's GIT_CONFIG_* environment
+# variables, so the token never lands in a URL, argv or the clone's config.
+_AUTH_HEADER = (
+    "Authorization: Basic "
+    + base64.b64encode(f"git:{OVERLEAF_TOKEN}".encode()).decode()
+    if OVERLEAF_TOKEN
+    else None
+)
+
+
+def _check_config() -> Optional[str]:
+    """
+    Validate the Overleaf environment variables.
+
+    Returns an error message, or None if the configuration is usable.
+    """
+    if not OVERLEAF_GIT_URL or not OVERLEAF_TOKEN:
+        return (
+            "Missing Overleaf configuration. Set OVERLEAF_GIT_URL and "
+            "OVERLEAF_TOKEN environment variables."
+        )
+
+    if not OVERLEAF_GIT_URL.startswith("https://"):
+        return "OVERLEAF_GIT_URL must start with https://"
+
+    # Parse the base URL (e.g. https://git.overleaf.com/<project-id>)
+    if not urlparse(OVERLEAF_GIT_URL).hostname:
+        return f"Invalid OVERLEAF_GIT_URL: {OVERLEAF_GIT_URL}"
+
+    return None
+
+
+# The environment is fixed for the life of the process, so validate it once.
+# Tools report the error when called rather than failing server startup.
+_CONFIG_ERROR = _check_config()
 
-def run(cmd, cwd=None):
+
+async def run(cmd, cwd=None, check=True, input=None):
     """
     Run a shell command and capture stderr/stdout so we can see git errors.
+
+    The process runs via asyncio so a slow clone or push does not block the
+    event loop for other tool calls.
+
+    With check=False a non-zero exit is returned to the caller instead of
+    raising, for commands whose failure is an expected outcome.
+
+    Output is kept as bytes; it is only decoded for the error message, and
+    callers that need stdout decode it themselves. `input` (bytes) is fed
+    to the command's stdin.
     """
-    result = subprocess.run(
-        cmd,
+    # Fail fast on bad credentials instead of hanging on a prompt, and keep
+    # git's messages in English since callers match on them
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0", "LC_ALL": "C"}
+    if _AUTH_HEADER:
+        # Applies to lazy blob fetches from the partial clone as well.
+        # Append after any GIT_CONFIG_* entries the user already set.
+        n = int(env.get("GIT_CONFIG_COUNT") or 0)
+        env.update({
+            "GIT_CONFIG_COUNT": str(n + 1),
+            f"GIT_CONFIG_KEY_{n}": "http.extraHeader",
+            f"GIT_CONFIG_VALUE_{n}": _AUTH_HEADER,
+        })
+
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
         cwd=cwd,
-        capture_output=True,
-        text=True,
+        stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
     )
+    out, err = await proc.communicate(input)
+    result = subprocess.CompletedProcess(cmd, proc.returncode, out, err)
 
-    if result.returncode != 0:
+    if check and result.returncode != 0:
+        stdout = result.stdout.decode("utf-8", "replace")
+        stderr = result.stderr.decode("utf-8", "replace")
         raise RuntimeError(
             f"Command failed: {' '.join(cmd)}\n"
             f"returncode: {result.returncode}\n"
-            f"stdout:\n{result.stdout}\n"
-            f"stderr:\n{result.stderr}"
+            f"stdout:\n{stdout}\n"
+            f"stderr:\n{stderr}"
         )
 
     return result
 
 
-def clone_overleaf_repo() -> Path:
+@contextlib.asynccontextmanager
+async def _locked_repo():
+    """
+    Hold exclusive access to the cached clone: the asyncio lock orders tool
+    calls in this process, a flock on a file next to the clone orders other
+    server processes using the same project.
+    """
+    async with _REPO_LOCK:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_CACHE_DIR / "lock", "w") as lock_file:
+            if fcntl is not None:
+                await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            yield
+
+
+async def sync_overleaf_repo(force: bool = False) -> Path:
     """
-    Clone the Overleaf Git repository using the Git auth token.
+    Bring the persistent Overleaf working copy up to date and return its path.
+
+    The first call does a shallow, blobless clone without a checkout; later
+    calls fetch the latest commit and reset the index onto it. File contents
+    are never checked out up front: _read_repo_file pulls the single blob a
+    tool needs on demand. Callers must hold _locked_repo().
+
+    A fetch is skipped if the last sync was under _SYNC_MAX_AGE seconds ago,
+    unless `force` is set (writes must build on the latest commit).
 
     OVERLEAF_GIT_URL should be the plain project URL, e.g.:
         https://git.overleaf.com/<project-id>
 
     OVERLEAF_TOKEN is your Git authentication token from Overleaf.
     """
-    if not OVERLEAF_GIT_URL or not OVERLEAF_TOKEN:
-        raise RuntimeError(
-            "Missing Overleaf configuration. Set OVERLEAF_GIT_URL and "
-            "OVERLEAF_TOKEN environment variables."
-        )
-
-    if not OVERLEAF_GIT_URL.startswith("https://"):
-        raise RuntimeError("OVERLEAF_GIT_URL must start with https://")
+    if _CONFIG_ERROR:
+        raise RuntimeError(_CONFIG_ERROR)
+
+    if (_REPO_DIR / ".git").is_dir():
+        try:
+            age = time.time() - _SYNC_STAMP.stat().st_mtime
+        except FileNotFoundError:
+            age = None
+        if not force and age is not None and 0 <= age < _SYNC_MAX_AGE:
+            return _REPO_DIR
+
+        await run(["git", "fetch", "-q", "--depth=1", "origin"], cwd=_REPO_DIR)
+        await run(["git", "reset", "-q", "FETCH_HEAD"], cwd=_REPO_DIR)
+        # Drop anything a failed edit may have left behind
+        await run(["git", "clean", "-q", "-fdx"], cwd=_REPO_DIR)
+        _SYNC_STAMP.touch()
+        return _REPO_DIR
+
+    # Clear out any half-finished clone from an earlier run
+    shutil.rmtree(_REPO_DIR, ignore_errors=True)
+    await run([
+        "git", "-c", "protocol.version=2",
+        "clone", "-q", "--depth=1", "--single-branch", "--no-tags",
+        "--filter=blob:none", "--no-checkout",
+        OVERLEAF_GIT_URL, str(_REPO_DIR),
+    ])
+    _default_branch.cache_clear()
+    # Mark every path skip-worktree so status/commit never fault in blobs,
+    # then fill the index from HEAD (trees only).
+    await run(["git", "sparse-checkout", "set", "--no-cone", "!/*"], cwd=_REPO_DIR)
+    await run(["git", "reset", "-q"], cwd=_REPO_DIR)
+    _SYNC_STAMP.touch()
+
+    return _REPO_DIR
+
+
+async def _read_repo_file(
+    repo_dir: Path, path: str
+) -> Optional[tuple[bytes, str]]:
+    """
+    Read a file's bytes and git mode (e.g. "100644") from the synced commit
+    without touching the working tree.
 
-    # Create temp dir and keep a global reference so it's not cleaned up early
-    tmpdir = tempfile.TemporaryDirectory()
-    repo_dir = Path(tmpdir.name) / "project"
-    if "_TMPDIRS" not in globals():
-        globals()["_TMPDIRS"] = []
-    globals()["_TMPDIRS"].append(tmpdir)
+    Only the blob for `path` is downloaded (lazily, via the partial clone).
+    Returns None if `path` is not a file in the project.
+    """
+    listing = await run(
+        ["git", "ls-tree", "-z", "--full-name", "HEAD", "--", path],
+        cwd=repo_dir,
+        check=False,
+    )
+    # Paths outside the repo ("../x", "/x") make ls-tree fail
+    if listing.returncode != 0:
+        return None
+
+    # "<mode> <type> <sha>\t<path>\0" per entry. A directory path lists its
+    # children instead, so require exactly one entry naming `path` itself.
+    entries = [e for e in listing.stdout.split(b"\0") if e]
+    if len(entries) != 1:
+        return None
+    meta, _, entry_path = entries[0].partition(b"\t")
+    fields = meta.split()
+    if (
+        len(fields) != 3
+        or fields[1] != b"blob"
+        or entry_path.decode("utf-8") != posixpath.normpath(path)
+    ):
+        return None
+
+    blob = await run(["git", "cat-file", "blob", fields[2].decode()], cwd=repo_dir)
+    return blob.stdout, fields[0].decode()
+
+
+# Extensions treated as binary even without a .gitattributes entry: figures,
+# PDFs, fonts and archives that Overleaf projects commonly carry.
+_BINARY_EXTENSIONS = frozenset({
+    ".pdf", ".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tif", ".tiff",
+    ".webp", ".ico", ".otf", ".ttf", ".woff", ".woff2",
+    ".zip", ".gz", ".tgz", ".docx", ".xlsx", ".pptx",
+})
+
+
+def _is_binary_path(path: str) -> bool:
+    """Guess from the file extension whether `path` holds binary data."""
+    return os.path.splitext(path)[1].lower() in _BINARY_EXTENSIONS
+
+
+async def _binary_attr_paths(repo_dir: Path, paths: list[str]) -> set[str]:
+    """
+    Return the subset of `paths` that the project's .gitattributes mark as
+    binary. Together with _is_binary_path this is the one rule both the
+    listing and the read tool use to decide a file is binary.
+    """
+    result = await run(
+        ["git", "check-attr", "-z", "--cached", "--stdin", "binary"],
+        cwd=repo_dir,
+        input="\0".join(paths).encode("utf-8") + b"\0",
+    )
+    # -z output: "<path>\0binary\0<value>\0" per path
+    fields = result.stdout.split(b"\0")
+    return {
+        fields[i].decode("utf-8")
+        for i in range(0, len(fields) - 2, 3)
+        if fields[i + 2] == b"set"
+    }
 
-    # Parse the base URL (e.g. https://git.overleaf.com/<project-id>)
-    parsed = urlparse(OVERLEAF_GIT_URL)
-    if not parsed.hostname:
-        raise RuntimeError(f"Invalid OVERLEAF_GIT_URL: {OVERLEAF_GIT_URL}")
 
-    # Overleaf expects: username "git", password = token.
-    # We embed that as: https://git:<token>@git.overleaf.com/<project-id>
-    user = "git"
-    password = quote(OVERLEAF_TOKEN, safe="")
+@functools.lru_cache(maxsize=1)
+def _default_branch(repo_dir: Path) -> str:
+    """
+    Name of the branch the clone is on, i.e. the project's default branch.
 
-    host = parsed.hostname
-    netloc = f"{user}:{password}@{host}"
-    if parsed.port:
-        netloc += f":{parsed.port}"
+    Read once from .git/HEAD so pushes go straight to the right branch
+    instead of trying "main" and falling back to "master".
+    """
+    head = (repo_dir / ".git" / "HEAD").read_text(encoding="utf-8").strip()
+    prefix = "ref: refs/heads/"
+    if not head.startswith(prefix):
+        raise RuntimeError(f"Overleaf clone is not on a branch: {head}")
+    return head[len(prefix):]
 
-    auth_url = urlunparse(parsed._replace(netloc=netloc))
 
-    # Perform git clone
-    run(["git", "clone", auth_url, str(repo_dir)])
+async def _push(repo_dir: Path, branch: str) -> None:
+    """
+    Push the current commit to `branch` on origin.
 
-    return repo_dir
+    Pushing from a shallow clone works as long as the remote has our
+    shallow base; if it refuses, deepen the clone once and retry.
+    """
+    try:
+        await run(["git", "push", "-q", "origin", branch], cwd=repo_dir)
+    except RuntimeError as e:
+        if "shallow" not in str(e):
+            raise
+        await run(["git", "fetch", "-q", "--unshallow", "origin"], cwd=repo_dir)
+        await run(["git", "push", "-q", "origin", branch], cwd=repo_dir)
 
 
 def normalize_latex_content(s: str) -> str:
@@ -97,6 +320,23 @@ def normalize_latex_content(s: str) -> str:
     return s.replace("\\n", "\\\n")
 
 
+# Section-like commands rendered as headings by _latex_preview. Only these
+# command names can match, so other macros fail in a single regex scan.
+_PREVIEW_SECTION_RE = re.compile(
+    r"\\(?:section|subsection|subsubsection|cvsection|chapter|sect)\*?\{([^}]*)\}"
+)
+
+# Comments, preamble and document env markers, dropped from the preview.
+# str.startswith checks the whole tuple in one call.
+_PREVIEW_SKIP_PREFIXES = (
+    "%",
+    "\\documentclass",
+    "\\usepackage",
+    "\\begin{document}",
+    "\\end{document}",
+)
+
+
 def _latex_preview(text: str) -> str:
     """
     Produce a human-friendly preview from LaTeX:
@@ -108,35 +348,29 @@ def _latex_preview(text: str) -> str:
     lines = text.splitlines()
     out: list[str] = []
 
-    section_cmds = ["section", "subsection", "subsubsection", "cvsection", "chapter", "sect"]
-
     for line in lines:
         stripped = line.strip()
         if not stripped:
             continue
-        if stripped.startswith("%"):
-            continue
-        if stripped.startswith("\\documentclass"):
-            continue
-        if stripped.startswith("\\usepackage"):
-            continue
-        if stripped.startswith("\\begin{document}") or stripped.startswith("\\end{document}"):
+        if stripped.startswith(_PREVIEW_SKIP_PREFIXES):
             continue
 
-        # Section-like commands: \section{Title}, \sect{Title}, etc.
-        m = re.match(r"\\([a-zA-Z]+)\*?\{([^}]*)\}", stripped)
-        if m and m.group(1) in section_cmds:
-            title = m.group(2).strip()
-            out.append("")
-            out.append(title.upper())
-            out.append("-" * len(title))
-            continue
-
-        # \item lines -> bullet points
-        if stripped.startswith("\\item"):
-            content = stripped[len("\\item"):].lstrip()
-            out.append(f"- {content}")
-            continue
+        # Plain text lines skip the command checks entirely
+        if stripped[0] == "\\":
+            # Section-like commands: \section{Title}, \sect{Title}, etc.
+            m = _PREVIEW_SECTION_RE.match(stripped)
+            if m:
+                title = m.group(1).strip()
+                out.append("")
+                out.append(title.upper())
+                out.append("-" * len(title))
+                continue
+
+            # \item lines -> bullet points
+            if stripped.startswith("\\item"):
+                content = stripped[len("\\item"):].lstrip()
+                out.append(f"- {content}")
+                continue
 
         # Default: include line as-is
         out.append(stripped)
@@ -144,8 +378,37 @@ def _latex_preview(text: str) -> str:
     return "\n".join(out).strip()
 
 
+@functools.lru_cache(maxsize=64)
+def _section_regex(heading_command: str, section_title: str) -> re.Pattern:
+    """
+    Compile the regex that matches a section header and its body.
+
+    Cached so repeated edits of the same section skip re-compiling.
+    """
+    heading_cmd_escaped = re.escape(heading_command)
+    title_escaped = re.escape(section_title)
+
+    # Match:
+    #   \sect{TITLE}<whitespace>BODY_UP_TO_NEXT_SECTION_OR_END
+    # or
+    #   \section{TITLE}...
+    pattern = (
+        rf"(\\{heading_cmd_escaped}\*?\{{{title_escaped}\}}\s*)"  # group 1: header
+        rf"(.*?)"                                                # group 2: body
+        rf"(?=("                                                 # lookahead: stop before next header/end
+        rf"\\{heading_cmd_escaped}\b|"
+        rf"\\section\b|"
+        rf"\\subsection\b|"
+        rf"\\chapter\b|"
+        rf"\\cvsection\b|"
+        rf"\\end\{{document\}}"
+        rf"))"
+    )
+    return re.compile(pattern, re.DOTALL)
+
+
 @mcp.tool
-def read_overleaf_file(
+async def read_overleaf_file(
     path: str = "main.tex",
     raw: bool = False,
 ) -> str:
@@ -159,18 +422,36 @@ def read_overleaf_file(
     raw : bool
         If True, return full LaTeX source.
         If False, return a human-friendly preview.
-    """
-    try:
-        repo_dir = clone_overleaf_repo()
-    except Exception as e:
-        return f"Git clone failed:\n{e}"
 
-    file_path = repo_dir / path
+    Binary files (figures, PDFs, ...) are returned base64-encoded after a
+    one-line header instead of being decoded as text.
+    """
+    async with _locked_repo():
+        try:
+            repo_dir = await sync_overleaf_repo()
+        except Exception as e:
+            return f"Git sync failed:\n{e}"
+
+        entry = await _read_repo_file(repo_dir, path)
+        binary = _is_binary_path(path) or (
+            entry is not None
+            and path in await _binary_attr_paths(repo_dir, [path])
+        )
 
-    if not file_path.exists():
+    if entry is None:
         return f"File '{path}' does not exist in the Overleaf project."
+    data, _ = entry
+
+    content = None
+    if not binary:
+        try:
+            content = data.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
 
-    content = file_path.read_text(encoding="utf-8")
+    if content is None:
+        encoded = base64.b64encode(data).decode("ascii")
+        return f"Binary file '{path}' ({len(data)} bytes), base64:\n{encoded}"
 
     if raw:
         return content
@@ -179,34 +460,35 @@ def read_overleaf_file(
 
 
 @mcp.tool
-def list_overleaf_files() -> list[str]:
+async def list_overleaf_files() -> list[dict]:
     """
     List all files in the Overleaf project (recursively).
     Does NOT include .git directory.
-    Returns a list of relative file paths.
+    Returns a list of {"path": <relative path>, "binary": <bool>} entries;
+    binary files (figures, PDFs, ...) cannot be shown as LaTeX text.
     """
-    try:
-        repo_dir = clone_overleaf_repo()
-    except Exception as e:
-        return [f"Git clone failed: {e}"]
-
-    file_paths: list[str] = []
-
-    for root, dirs, files in os.walk(repo_dir):
-        # Skip .git
-        if ".git" in dirs:
-            dirs.remove(".git")
-
-        for file in files:
-            full_path = Path(root) / file
-            rel_path = full_path.relative_to(repo_dir)
-            file_paths.append(str(rel_path))
-
-    return file_paths
+    async with _locked_repo():
+        try:
+            repo_dir = await sync_overleaf_repo()
+        except Exception as e:
+            return [{"error": f"Git sync failed: {e}"}]
+
+        # The working tree is never checked out, so list from the index
+        listing = await run(["git", "ls-files", "-z"], cwd=repo_dir)
+        paths = [p.decode("utf-8") for p in listing.stdout.split(b"\0") if p]
+        # Most projects have no .gitattributes; skip check-attr for them
+        binary_attr = set()
+        if any(posixpath.basename(p) == ".gitattributes" for p in paths):
+            binary_attr = await _binary_attr_paths(repo_dir, paths)
+
+    return [
+        {"path": p, "binary": p in binary_attr or _is_binary_path(p)}
+        for p in paths
+    ]
 
 
 @mcp.tool
-def update_overleaf_section(
+async def update_overleaf_section(
     path: str,
     section_title: str,
     new_section_body: str,
@@ -238,80 +520,95 @@ def update_overleaf_section(
     commit_message : str | None
         Optional git commit message.
     """
-    try:
-        repo_dir = clone_overleaf_repo()
-    except Exception as e:
-        return f"Git clone failed:\n{e}"
-
-    file_path = repo_dir / path
-    if not file_path.exists():
-        return f"File '{path}' does not exist in the Overleaf project."
-
-    text = file_path.read_text(encoding="utf-8")
-
-    heading_cmd_escaped = re.escape(heading_command)
-    title_escaped = re.escape(section_title)
-
-    # Match:
-    #   \sect{TITLE}<whitespace>BODY_UP_TO_NEXT_SECTION_OR_END
-    # or
-    #   \section{TITLE}...
-    pattern = (
-        rf"(\\{heading_cmd_escaped}\*?\{{{title_escaped}\}}\s*)"  # group 1: header
-        rf"(.*?)"                                                # group 2: body
-        rf"(?=("                                                 # lookahead: stop before next header/end
-        rf"\\{heading_cmd_escaped}\b|"
-        rf"\\section\b|"
-        rf"\\subsection\b|"
-        rf"\\chapter\b|"
-        rf"\\cvsection\b|"
-        rf"\\end\{{document\}}"
-        rf"))"
-    )
-    regex = re.compile(pattern, re.DOTALL)
-
-    # Normalize new section body before inserting (fix \n issues)
-    new_section_body = normalize_latex_content(new_section_body)
-
-    def replacer(match: re.Match) -> str:
-        header = match.group(1)
-        body = new_section_body.strip() + "\n"
-        return header + body
-
-    new_text, count = regex.subn(replacer, text, count=1)
+    async with _locked_repo():
+        try:
+            repo_dir = await sync_overleaf_repo(force=True)
+        except Exception as e:
+            return f"Git sync failed:\n{e}"
+
+        entry = await _read_repo_file(repo_dir, path)
+        if entry is None:
+            return f"File '{path}' does not exist in the Overleaf project."
+        data, git_mode = entry
+        try:
+            text = data.decode("utf-8")
+        except UnicodeDecodeError:
+            return f"File '{path}' is not a UTF-8 text file. No changes made."
+
+        regex = _section_regex(heading_command, section_title)
+
+        match = regex.search(text)
+        if match is None:
+            return (
+                f"Section '{section_title}' with heading '\\{heading_command}' "
+                f"not found in '{path}'. No changes made."
+            )
+
+        # Normalize new section body before inserting (fix \n issues)
+        body = normalize_latex_content(new_section_body).strip() + "\n"
+        if "\r\n" in text:
+            # Match a CRLF file's line endings instead of mixing in bare LFs
+            body = body.replace("\r\n", "\n").replace("\n", "\r\n")
+        if text[match.start(2):match.end(2)] == body:
+            # Nothing would change: skip the write, commit and push
+            return "No changes to commit after section replacement."
+
+        # From here the clone may diverge from Overleaf (e.g. a rejected
+        # push), so make the next tool call fetch until the push succeeds.
+        _SYNC_STAMP.unlink(missing_ok=True)
+
+        # Only the edited file is ever materialised in the working tree.
+        # Write the text around the old body straight out instead of first
+        # assembling the whole new file; newline="" writes `\r\n` unchanged.
+        # Writing to a temp file and renaming means a crash mid-write can
+        # never leave a truncated file for the commit to pick up; a stray
+        # temp file is removed by the next sync's `git clean`.
+        file_path = repo_dir / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", newline="", dir=file_path.parent, delete=False
+        ) as f:
+            f.writelines((text[:match.start(2)], body, text[match.end(2):]))
+        # NamedTemporaryFile is 0600; give it the mode git records so the
+        # commit does not drop an executable bit.
+        perm = 0o755 if git_mode == "100755" else 0o644
+        os.chmod(f.name, perm & ~_UMASK)
+        os.replace(f.name, file_path)
+
+        if commit_message is None:
+            commit_message = f"Update section '{section_title}' in {path}"
+
+        # Identity via -c and staging via the pathspec: one git process
+        # instead of config/config/add/commit.
+        email = OVERLEAF_EMAIL or "overleaf-mcp@example.com"
+        result = await run(
+            [
+                "git",
+                "-c", "user.name=Overleaf MCP Bot",
+                "-c", f"user.email={email}",
+                "commit", "-q", "-m", commit_message, "--", path,
+            ],
+            cwd=repo_dir,
+            check=False,
+        )
+        if result.returncode != 0:
+            if b"nothing to commit" in result.stdout + result.stderr:
+                return "No changes to commit after section replacement."
+            stderr = result.stderr.decode("utf-8", "replace")
+            return f"Git commit failed:\n{stderr}"
+
+        try:
+            await _push(repo_dir, _default_branch(repo_dir))
+        except RuntimeError as e:
+            # The stamp is already gone, so the next call refetches
+            return f"Git push failed:\n{e}"
+        _SYNC_STAMP.touch()
 
-    if count == 0:
         return (
-            f"Section '{section_title}' with heading '\\{heading_command}' "
-            f"not found in '{path}'. No changes made."
+            f"Successfully updated section '{section_title}' in '{path}' "
+            f"and pushed to Overleaf."
         )
 
-    file_path.write_text(new_text, encoding="utf-8")
-
-    email = OVERLEAF_EMAIL or "overleaf-mcp@example.com"
-    run(["git", "config", "user.name", "Overleaf MCP Bot"], cwd=repo_dir)
-    run(["git", "config", "user.email", email], cwd=repo_dir)
-
-    run(["git", "add", path], cwd=repo_dir)
-
-    if commit_message is None:
-        commit_message = f"Update section '{section_title}' in {path}"
-
-    try:
-        run(["git", "commit", "-m", commit_message], cwd=repo_dir)
-    except RuntimeError:
-        return "No changes to commit after section replacement."
-
-    try:
-        run(["git", "push", "origin", "main"], cwd=repo_dir)
-    except RuntimeError:
-        run(["git", "push", "origin", "master"], cwd=repo_dir)
-
-    return (
-        f"Successfully updated section '{section_title}' in '{path}' "
-        f"and pushed to Overleaf."
-    )
-
 
 if __name__ == "__main__":
     mcp.run()